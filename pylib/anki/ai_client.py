@@ -1,15 +1,70 @@
 # pylib/anki/ai_client.py
+import dataclasses
+import gzip
+import hashlib
 import json
 import logging
 import os
+import re
+import sqlite3
 import textwrap
-import urllib.error
-import urllib.request
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
 from dataclasses import dataclass
+from typing import Any, Callable, Final
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from anki.utils import from_json_bytes, to_json_bytes
 
 logger = logging.getLogger(__name__)
 
-GEMINI_SYSTEM_INSTRUCTION = textwrap.dedent(
+REQUEST_TIMEOUT: Final = 60
+CACHE_MAX_ENTRIES: Final = 1024
+CACHE_TTL_SECS: Final = 30 * 86400
+# per graded item; enough for the reasoning steps plus the four JSON fields
+MAX_OUTPUT_TOKENS: Final = 1024
+# request bodies below this are sent uncompressed
+GZIP_MIN_BYTES: Final = 1024
+CACHED_CONTENT_TTL: Final = "3600s"
+# after a transient registration failure (timeout, 429, 5xx), try again later
+CACHED_CONTENT_RETRY_SECS: Final = 300
+CACHED_CONTENTS_URL: Final = (
+    "https://generativelanguage.googleapis.com/v1beta/cachedContents?key={api_key}"
+)
+
+DEFAULT_MODEL: Final = "gemini-2.5-flash-lite"
+GENERATE_URL_TEMPLATE: Final = "https://generativelanguage.googleapis.com/v1beta/models/{model}:generateContent?key={api_key}"
+STREAM_URL_TEMPLATE: Final = "https://generativelanguage.googleapis.com/v1beta/models/{model}:streamGenerateContent?alt=sse&key={api_key}"
+OLLAMA_DEFAULT_MODEL: Final = "phi4"
+OLLAMA_HOST: Final = "http://localhost:11434"
+OLLAMA_KEEP_ALIVE: Final = "30m"
+
+
+def _make_session() -> requests.Session:
+    # One pooled session per process, so repeated grades reuse the same
+    # keep-alive connection instead of paying a TCP+TLS handshake each time.
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=8,
+        max_retries=Retry(total=2, backoff_factor=0.2),
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update(
+        {"Content-Type": "application/json", "Connection": "keep-alive"}
+    )
+    return session
+
+
+_HTTP = _make_session()
+
+GEMINI_SYSTEM_INSTRUCTION: Final = textwrap.dedent(
     """
 You are a dual-persona expert: a STRICT FAANG-level Senior Staff Technical Interviewer AND an elite Cognitive Science Performance Coach. Your singular objective is to evaluate technical flashcard answers to ensure the candidate develops flawless, deeply retained mental models capable of passing the most rigorous system design and coding interviews.
 
@@ -55,6 +110,7 @@ This string must be exactly TWO concise sentences.
 
 STRICT JSON CONSTRAINTS
 After closing the </thought_process> tag, you must output ONLY a valid JSON object. No markdown formatting around the JSON, no trailing text.
+If multiple ITEM blocks are given, evaluate each independently and instead output a JSON array with one object per ITEM, in order.
 
 REQUIRED FORMAT
 <thought_process>
@@ -73,6 +129,173 @@ REQUIRED FORMAT
 """
 ).strip()
 
+# In schema mode the reply can't carry a <thought_process> block, so the
+# reasoning gets its own leading field; AIEvalResult ignores it.
+RESPONSE_SCHEMA: Final[dict[str, Any]] = {
+    "type": "object",
+    "properties": {
+        "thought_process": {
+            "type": "string",
+            "description": "The numbered <thought_process> reasoning steps.",
+        },
+        "verdict": {
+            "type": "string",
+            "enum": ["Correct", "Partially Correct", "Incorrect"],
+        },
+        "suggested_rating": {"type": "integer", "minimum": 1, "maximum": 4},
+        "key_fix": {"type": "string"},
+        "memory_tip": {"type": "string"},
+    },
+    "required": [
+        "thought_process",
+        "verdict",
+        "suggested_rating",
+        "key_fix",
+        "memory_tip",
+    ],
+    # reason first, so the grade is decoded after the analysis
+    "propertyOrdering": [
+        "thought_process",
+        "verdict",
+        "suggested_rating",
+        "key_fix",
+        "memory_tip",
+    ],
+}
+
+# part of the result cache key, so grades made under an older prompt or
+# schema aren't served after either changes
+_PROMPT_VERSION: Final = hashlib.blake2b(
+    to_json_bytes([GEMINI_SYSTEM_INSTRUCTION, RESPONSE_SCHEMA]), digest_size=8
+).hexdigest()
+
+# first "text" string in a generateContent envelope, ie
+# candidates[0].content.parts[0].text; escapes are left for the JSON decoder
+_TEXT_RE: Final = re.compile(rb'"text"\s*:\s*"((?:\\.|[^"\\])*)"')
+
+
+def _extract_text(body: bytes) -> str:
+    """Pull the model output out of a Gemini response body, without
+    materializing the surrounding metadata (safety ratings, usage, etc)."""
+    if match := _TEXT_RE.search(body):
+        return from_json_bytes(b'"' + match.group(1) + b'"')
+    result = from_json_bytes(body)
+    try:
+        return result["candidates"][0]["content"]["parts"][0]["text"]
+    except (KeyError, IndexError, TypeError) as e:
+        raise ValueError("Gemini response missing expected fields.") from e
+
+
+def _chunk_text(chunk: bytes) -> str:
+    "Text carried by one streamed chunk; the final chunk may only hold metadata."
+    if match := _TEXT_RE.search(chunk):
+        return from_json_bytes(b'"' + match.group(1) + b'"')
+    return ""
+
+
+def _strip_wrapping(raw_text: str) -> str:
+    "Drop the <thought_process> block and any markdown fence around the JSON."
+    cleaned_text = raw_text.strip()
+    if "</thought_process>" in cleaned_text:
+        _, _, post_thought_process = cleaned_text.rpartition("</thought_process>")
+        if post_thought_process.strip():
+            cleaned_text = post_thought_process.strip()
+    if cleaned_text.startswith("```"):
+        lines = cleaned_text.splitlines()
+        if lines and lines[0].strip().startswith("```"):
+            lines = lines[1:]
+            if lines and lines[-1].strip() == "```":
+                lines = lines[:-1]
+            cleaned_text = "\n".join(lines).strip()
+        if cleaned_text.lower().startswith("json"):
+            cleaned_text = cleaned_text[4:].strip()
+    return cleaned_text
+
+
+def _extract_object(raw_text: str) -> str:
+    "Best-effort isolation of a JSON object from free-form model output."
+    cleaned_text = _strip_wrapping(raw_text)
+    if not (cleaned_text.startswith("{") and cleaned_text.endswith("}")):
+        start = cleaned_text.find("{")
+        end = cleaned_text.rfind("}")
+        if start != -1 and end != -1 and end > start:
+            cleaned_text = cleaned_text[start : end + 1]
+    return cleaned_text
+
+
+_VERDICT_SET: Final = frozenset(("Correct", "Partially Correct", "Incorrect"))
+_VERDICT_MAP: Final[dict[str, str]] = {
+    "pass": "Correct",
+    "borderline": "Partially Correct",
+    "fail": "Incorrect",
+}
+_RATING_MAP: Final[dict[int, str]] = {1: "Again", 2: "Hard", 3: "Good", 4: "Easy"}
+_RATING_LABELS: Final = frozenset(_RATING_MAP.values())
+
+
+def _matches_schema(data: dict[str, Any]) -> bool:
+    "True if data is exactly RESPONSE_SCHEMA's shape, needing no normalization."
+    try:
+        return (
+            data["verdict"] in _VERDICT_SET
+            and type(data["suggested_rating"]) is int
+            and data["suggested_rating"] in _RATING_MAP
+            and type(data["key_fix"]) is str
+            and type(data["memory_tip"]) is str
+            and bool(data["key_fix"])
+            and bool(data["memory_tip"])
+        )
+    except (KeyError, TypeError):
+        return False
+
+
+CLOZE_NOTE: Final = (
+    "\n\n[IMPORTANT NOTE: This is a CLOZE (fill-in-the-blank) card. "
+    "The 'CORRECT_ANSWER' will be a full sentence. The 'USER_ANSWER' "
+    "will be a text fragment. If the fragment correctly fills the blank "
+    "in the context of the question, mark it as 'Correct'.]"
+)
+
+
+def _fmt_user(
+    question: str,
+    correct_answer: str,
+    user_answer: str,
+    is_cloze: bool,
+    item: int | None = None,
+) -> str:
+    """The per-card part of the prompt, appended after the system instruction.
+    In a batch, item labels the block after its separator."""
+    label = "" if item is None else f"ITEM {item}\n"
+    return (
+        f"{CLOZE_NOTE if is_cloze else ''}\n\n***\n{label}"
+        f"FLASHCARD_QUESTION: {question}\n"
+        f"CORRECT_ANSWER: {correct_answer}\n"
+        f"USER_ANSWER: {user_answer}\n"
+    )
+
+
+def _always_thinks(model: str) -> bool:
+    """True for Gemini models whose thinking can't be switched off (2.5 Pro
+    and later), as opposed to 1.x/2.0 and the 2.5 Flash family."""
+    return model.startswith("gemini-") and not model.startswith(
+        ("gemini-1.", "gemini-2.0-", "gemini-2.5-flash")
+    )
+
+
+def _is_unsupported_status(status: int) -> bool:
+    "A 4xx that won't go away on retry, unlike timeouts and rate limits."
+    return 400 <= status < 500 and status not in (408, 429)
+
+
+def _is_cached_content_error(response: requests.Response | None) -> bool:
+    """True if Gemini rejected a request because its cachedContent has
+    expired or been evicted (reported as 403/404, or 400 on some models)."""
+    if response is None or response.status_code not in (400, 403, 404):
+        return False
+    return b"cachedcontent" in response.content.lower()
+
+
 @dataclass
 class AIEvalResult:
     verdict: str
@@ -82,18 +305,78 @@ class AIEvalResult:
     raw_response: str
 
 class AIClient:
+    # shared by all clients, so bursts of evaluations reuse a few long-lived
+    # threads (and their pooled connections) instead of spawning new ones
+    _executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="ai-eval")
+    requires_api_key = True
+    # bodies carrying the ~2 KB system instruction (cachedContents registration
+    # and inline prompts) compress well; a card message that references the
+    # cached instruction is too small to bother. Responses are already
+    # gzip-negotiated by requests
+    _gzip_ok = True
+
     def __init__(
         self,
         api_key: str | None = None,
-        api_url_template: str = "https://generativelanguage.googleapis.com/v1beta/models/gemma-3-27b-it:generateContent?key={api_key}",
-    ):
+        model: str | None = None,
+        api_url_template: str = GENERATE_URL_TEMPLATE,
+        stream_url_template: str = STREAM_URL_TEMPLATE,
+        cache_path: str | None = None,
+    ) -> None:
         self.api_key = api_key or os.environ.get("GEMINI_API_KEY")
+        # grading a short answer doesn't need a large model, and the lite
+        # tier has noticeably lower time-to-first-token
+        self.model = model or os.environ.get("ANKI_AI_MODEL") or DEFAULT_MODEL
         self.api_url_template = api_url_template
+        self.stream_url_template = stream_url_template
+        self._mem_cache: OrderedDict[str, AIEvalResult] = OrderedDict()
+        self._cache_lock = threading.Lock()
+        # opened lazily, and closed by close() when the caller is done with it
+        self.cache_path = cache_path
+        self._cache_db: sqlite3.Connection | None = None
+        self._cached_content_name: str | None = None
+        self._cached_content_supported = True
+        self._cached_content_retry_at = 0.0
+        self._cached_content_lock = threading.Lock()
+
+    def close(self) -> None:
+        "Close the on-disk cache; it is reopened on next use."
+        with self._cache_lock:
+            if self._cache_db:
+                self._cache_db.close()
+                self._cache_db = None
 
     def evaluate_card(
         self, front: str, back: str, user_answer: str, card_mode: str = "basic"
     ) -> AIEvalResult:
-        return self.generate_response(front, back, user_answer)
+        return self.generate_response(
+            front, back, user_answer, is_cloze=card_mode == "cloze"
+        )
+
+    def evaluate_card_async(
+        self, front: str, back: str, user_answer: str, card_mode: str = "basic"
+    ) -> Future[AIEvalResult]:
+        return self._executor.submit(
+            self.evaluate_card, front, back, user_answer, card_mode
+        )
+
+    def generate_response_async(
+        self,
+        question: str,
+        correct_answer: str,
+        user_answer: str,
+        is_cloze: bool = False,
+        on_partial: Callable[[str], None] | None = None,
+    ) -> Future[AIEvalResult]:
+        """Run generate_response() on the shared AI worker pool."""
+        return self._executor.submit(
+            self.generate_response,
+            question,
+            correct_answer,
+            user_answer,
+            is_cloze,
+            on_partial,
+        )
 
     def generate_response(
         self,
@@ -101,8 +384,15 @@ class AIClient:
         correct_answer: str,
         user_answer: str,
         is_cloze: bool = False,
+        on_partial: Callable[[str], None] | None = None,
     ) -> AIEvalResult:
-        if not self.api_key:
+        """Grade user_answer against the card.
+
+        If on_partial is provided, the response is streamed and on_partial is
+        called from the worker thread with the model text received so far.
+        Streaming is skipped when only api_url_template was customized, so
+        requests always go to the configured endpoint."""
+        if self.requires_api_key and not self.api_key:
             return AIEvalResult(
                 verdict="Incorrect",
                 suggested_rating="Again",
@@ -111,69 +401,29 @@ class AIClient:
                 raw_response="",
             )
 
-        prompt_text = GEMINI_SYSTEM_INSTRUCTION
-        if is_cloze:
-            prompt_text += (
-                "\n\n[IMPORTANT NOTE: This is a CLOZE (fill-in-the-blank) card. "
-                "The 'CORRECT_ANSWER' will be a full sentence. The 'USER_ANSWER' "
-                "will be a text fragment. If the fragment correctly fills the blank "
-                "in the context of the question, mark it as 'Correct'.]"
-            )
-        prompt_text += f"""
-
-***
-FLASHCARD_QUESTION: {question}
-CORRECT_ANSWER: {correct_answer}
-USER_ANSWER: {user_answer}
-"""
+        cache_key = self._cache_key(question, correct_answer, user_answer, is_cloze)
+        cached = self._cache_get(cache_key)
+        if cached is not None:
+            logger.info("AI cache hit: key=%s", cache_key)
+            return cached
 
-        payload = {
-            "contents": [
-                {
-                    "parts": [
-                        {
-                            "text": prompt_text,
-                        }
-                    ]
-                }
-            ],
-        }
+        user_message = _fmt_user(question, correct_answer, user_answer, is_cloze)
 
         try:
-            api_url = self.api_url_template.format(api_key=self.api_key)
-            logger.info("AI request: model_url=%s", self.api_url_template.split("?")[0])
+            logger.info("AI request: model=%s", self.model)
             logger.info("AI request: is_cloze=%s", is_cloze)
             logger.info(
-                "AI request: prompt_preview=%s",
-                prompt_text[:1000].replace("\n", "\\n"),
-            )
-            req = urllib.request.Request(
-                api_url,
-                data=json.dumps(payload).encode("utf-8"),
-                headers={"Content-Type": "application/json"},
-                method="POST",
+                "AI request: user_message_preview=%s",
+                user_message[:1000].replace("\n", "\\n"),
             )
-            with urllib.request.urlopen(req) as response:
-                raw_body = response.read().decode("utf-8")
-                print("\n[AI DEBUG] Raw GenAI HTTP response body:")
-                print(raw_body)
-                logger.info(
-                    "AI response: status=%s length=%s",
-                    getattr(response, "status", "unknown"),
-                    len(raw_body),
-                )
-                logger.info(
-                    "AI response: body_preview=%s",
-                    raw_body[:1000].replace("\n", "\\n"),
-                )
-                result = json.loads(raw_body)
-                try:
-                    content = result["candidates"][0]["content"]["parts"][0]["text"]
-                except (KeyError, IndexError, TypeError) as e:
-                    raise ValueError("Gemini response missing expected fields.") from e
-                print("\n[AI DEBUG] Raw model text (before parsing):")
-                print(content)
-                return self._parse_response(content, prompt_text)
+            content = self._generate([user_message], on_partial)
+            print("\n[AI DEBUG] Raw model text (before parsing):")
+            print(content)
+            parsed = self._parse_response(content, user_message)
+            # parse errors carry a "fail" verdict; don't persist those
+            if parsed.verdict in _VERDICT_SET:
+                self._cache_set(cache_key, parsed)
+            return parsed
 
         except Exception as e:
             print(f"[AI DEBUG] Request exception: {e}")
@@ -187,70 +437,352 @@ USER_ANSWER: {user_answer}
                 raw_response="",
             )
 
+    def evaluate_batch(
+        self, items: list[tuple[str, str, str, bool]]
+    ) -> list[AIEvalResult]:
+        """Grade several (question, correct_answer, user_answer, is_cloze)
+        items with a single request, sharing the system prompt between them.
+
+        Cached items are answered locally. If the batch request fails or the
+        reply can't be matched up with the items, each remaining item is
+        graded with its own request."""
+        results: list[AIEvalResult | None] = []
+        pending: list[int] = []
+        for idx, (question, correct_answer, user_answer, is_cloze) in enumerate(items):
+            cached = self._cache_get(
+                self._cache_key(question, correct_answer, user_answer, is_cloze)
+            )
+            results.append(cached)
+            if cached is None:
+                pending.append(idx)
+
+        if len(pending) > 1 and (self.api_key or not self.requires_api_key):
+            user_messages = [
+                _fmt_user(*items[idx], item=n) for n, idx in enumerate(pending)
+            ]
+            try:
+                content = self._generate(user_messages)
+                batch = self._parse_batch(content, len(pending))
+            except Exception:
+                logger.exception("AI batch request failed; grading items one by one")
+                batch = None
+            if batch is not None:
+                for idx, result in zip(pending, batch):
+                    results[idx] = result
+                    if result.verdict in _VERDICT_SET:
+                        self._cache_set(self._cache_key(*items[idx]), result)
+                pending = []
+
+        for idx in pending:
+            results[idx] = self.generate_response(*items[idx])
+        return [result for result in results if result is not None]
+
+    def _generate(
+        self,
+        user_messages: list[str],
+        on_partial: Callable[[str], None] | None = None,
+    ) -> str:
+        cached_content = self._ensure_cached_content()
+        try:
+            return self._send(
+                self._build_payload(user_messages, cached_content), on_partial
+            )
+        except requests.HTTPError as e:
+            if not cached_content or not _is_cached_content_error(e.response):
+                raise
+            # the cached system instruction has expired or been evicted;
+            # send the full prompt this time and re-register on next call
+            logger.info("AI cached content rejected: name=%s", cached_content)
+            self._cached_content_name = None
+            return self._send(self._build_payload(user_messages, None), on_partial)
+
+    def _send(
+        self, payload: dict[str, Any], on_partial: Callable[[str], None] | None
+    ) -> str:
+        if on_partial is None or not self._can_stream():
+            return self._request_content(self._endpoint(stream=False), payload)
+        return self._stream_content(self._endpoint(stream=True), payload, on_partial)
+
+    def _can_stream(self) -> bool:
+        # a custom generate endpoint with the stock stream one would send
+        # streamed requests somewhere the caller didn't ask for
+        return (
+            self.stream_url_template != STREAM_URL_TEMPLATE
+            or self.api_url_template == GENERATE_URL_TEMPLATE
+        )
+
+    def _endpoint(self, stream: bool) -> str:
+        template = self.stream_url_template if stream else self.api_url_template
+        return template.format(model=self.model, api_key=self.api_key)
+
+    def _build_payload(
+        self, user_messages: list[str], cached_content: str | None
+    ) -> dict[str, Any]:
+        payload: dict[str, Any]
+        if cached_content:
+            payload = {
+                "cachedContent": cached_content,
+                "contents": [
+                    {"role": "user", "parts": [{"text": message}]}
+                    for message in user_messages
+                ],
+            }
+        else:
+            # no system instruction support (eg Gemma), so it leads the first turn
+            texts = list(user_messages)
+            texts[0] = GEMINI_SYSTEM_INSTRUCTION + texts[0]
+            payload = {
+                "contents": [
+                    {"role": "user", "parts": [{"text": text}]} for text in texts
+                ],
+            }
+        structured = self.model.startswith("gemini-")
+        # cap decoding: the reply is the reasoning plus a small JSON object
+        # per item
+        generation_config: dict[str, Any] = {
+            "temperature": 0.1,
+            "topP": 0.9,
+            "candidateCount": 1,
+            "maxOutputTokens": MAX_OUTPUT_TOKENS * len(user_messages),
+        }
+        if self.model.startswith("gemini-2.5-flash"):
+            # thinking tokens count against maxOutputTokens; the reply carries
+            # its own reasoning, so turn thinking off rather than lose the JSON
+            generation_config["thinkingConfig"] = {"thinkingBudget": 0}
+        elif _always_thinks(self.model):
+            # a cap could be used up by thinking before any reply is written
+            del generation_config["maxOutputTokens"]
+        if structured:
+            # the server guarantees JSON in this shape, so the reply parses
+            # directly without the lenient cleanup pass
+            schema = RESPONSE_SCHEMA
+            if len(user_messages) > 1:
+                schema = {"type": "array", "items": RESPONSE_SCHEMA}
+            generation_config["responseMimeType"] = "application/json"
+            generation_config["responseSchema"] = schema
+        payload["generationConfig"] = generation_config
+        return payload
+
+    def _post(
+        self, api_url: str, payload: dict[str, Any], stream: bool = False
+    ) -> requests.Response:
+        body = to_json_bytes(payload)
+        if self._gzip_ok and len(body) >= GZIP_MIN_BYTES:
+            response = _HTTP.post(
+                api_url,
+                data=gzip.compress(body, compresslevel=1),
+                headers={"Content-Encoding": "gzip"},
+                timeout=REQUEST_TIMEOUT,
+                stream=stream,
+            )
+            if response.status_code != 415:
+                return response
+            # server won't take compressed bodies; stop trying this session
+            response.close()
+            logger.info("AI request: gzip body rejected, sending uncompressed")
+            self._gzip_ok = False
+        return _HTTP.post(api_url, data=body, timeout=REQUEST_TIMEOUT, stream=stream)
+
+    def _request_content(self, api_url: str, payload: dict[str, Any]) -> str:
+        with self._post(api_url, payload) as response:
+            response.raise_for_status()
+            raw_body = response.content
+            print("\n[AI DEBUG] Raw GenAI HTTP response body:")
+            print(raw_body.decode("utf-8", "replace"))
+            logger.info(
+                "AI response: status=%s length=%s",
+                response.status_code,
+                len(raw_body),
+            )
+            logger.info(
+                "AI response: body_preview=%s",
+                raw_body[:1000].decode("utf-8", "replace").replace("\n", "\\n"),
+            )
+            return self._read_content(raw_body)
+
+    def _read_content(self, body: bytes) -> str:
+        return _extract_text(body)
+
+    def _stream_content(
+        self,
+        api_url: str,
+        payload: dict[str, Any],
+        on_partial: Callable[[str], None],
+    ) -> str:
+        """Read a server-sent event stream, reporting the accumulated text
+        after each chunk so the UI can show progress before the reply ends.
+
+        The stream is read to the end rather than stopping at the first
+        parseable JSON, so the pooled connection can be reused."""
+        pieces: list[str] = []
+        with self._post(api_url, payload, stream=True) as response:
+            logger.info("AI response: streaming status=%s", response.status_code)
+            if not response.ok:
+                # read the error body while the connection is open, so the
+                # caller can inspect it after the stream is closed
+                response.content
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if not line.startswith(b"data:"):
+                    continue
+                if text := _chunk_text(line[5:].strip()):
+                    pieces.append(text)
+                    on_partial("".join(pieces))
+        content = "".join(pieces)
+        logger.info(
+            "AI response: streamed chunks=%s length=%s", len(pieces), len(content)
+        )
+        if not pieces:
+            raise ValueError("Gemini response missing expected fields.")
+        return content
+
+    # Prompt caching
+    ##########################################################################
+
+    def _ensure_cached_content(self) -> str | None:
+        """Register the system instruction with Gemini's cachedContents API
+        once, so later requests can reference it instead of resending it.
+
+        Returns None when the model doesn't support explicit caching (eg Gemma,
+        or an instruction below the minimum cacheable size), in which case the
+        full prompt is sent inline."""
+        if not self.model.startswith("gemini-"):
+            return None
+        with self._cached_content_lock:
+            if self._cached_content_name or not self._cached_content_supported:
+                return self._cached_content_name
+            if time.time() < self._cached_content_retry_at:
+                return None
+            payload = {
+                "model": f"models/{self.model}",
+                "systemInstruction": {"parts": [{"text": GEMINI_SYSTEM_INSTRUCTION}]},
+                "ttl": CACHED_CONTENT_TTL,
+            }
+            try:
+                with self._post(
+                    CACHED_CONTENTS_URL.format(api_key=self.api_key), payload
+                ) as response:
+                    if _is_unsupported_status(response.status_code):
+                        logger.info(
+                            "AI cached content unsupported: status=%s body=%s",
+                            response.status_code,
+                            response.content[:200],
+                        )
+                        self._cached_content_supported = False
+                        return None
+                    response.raise_for_status()
+                    self._cached_content_name = from_json_bytes(response.content)[
+                        "name"
+                    ]
+            except Exception:
+                logger.exception("AI cached content failed; retrying later")
+                self._cached_content_retry_at = time.time() + CACHED_CONTENT_RETRY_SECS
+                return None
+            logger.info("AI cached content created: name=%s", self._cached_content_name)
+            return self._cached_content_name
+
+    # Result cache
+    ##########################################################################
+
+    def _cache_key(
+        self, question: str, correct_answer: str, user_answer: str, is_cloze: bool
+    ) -> str:
+        norm_answer = user_answer.strip().lower()
+        return hashlib.blake2b(
+            f"{_PROMPT_VERSION}|{self.model}|{int(is_cloze)}|"
+            f"{question}|{correct_answer}|{norm_answer}".encode("utf-8"),
+            digest_size=16,
+        ).hexdigest()
+
+    @staticmethod
+    def _open_cache_db(path: str) -> sqlite3.Connection:
+        db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS ai_eval_cache "
+            "(key TEXT PRIMARY KEY, json BLOB NOT NULL, ts INTEGER NOT NULL)"
+        )
+        # expired rows are never read again
+        db.execute(
+            "DELETE FROM ai_eval_cache WHERE ts <= ?",
+            (int(time.time()) - CACHE_TTL_SECS,),
+        )
+        return db
+
+    def _db(self) -> sqlite3.Connection | None:
+        "The on-disk cache, opening it if needed. Caller must hold _cache_lock."
+        if self._cache_db is None and self.cache_path:
+            try:
+                self._cache_db = self._open_cache_db(self.cache_path)
+            except sqlite3.Error:
+                logger.exception("AI cache unavailable: path=%s", self.cache_path)
+                self.cache_path = None
+        return self._cache_db
+
+    def _cache_get(self, key: str) -> AIEvalResult | None:
+        with self._cache_lock:
+            result = self._mem_cache.get(key)
+            if result is not None:
+                self._mem_cache.move_to_end(key)
+                return result
+            if not (db := self._db()):
+                return None
+            try:
+                row = db.execute(
+                    "SELECT json FROM ai_eval_cache WHERE key = ? AND ts > ?",
+                    (key, int(time.time()) - CACHE_TTL_SECS),
+                ).fetchone()
+            except sqlite3.Error:
+                logger.exception("AI cache read failed")
+                return None
+            if not row:
+                return None
+            try:
+                result = AIEvalResult(**from_json_bytes(row[0]))
+            except (TypeError, ValueError):
+                return None
+            self._remember(key, result)
+            return result
+
+    def _cache_set(self, key: str, result: AIEvalResult) -> None:
+        with self._cache_lock:
+            self._remember(key, result)
+            if not (db := self._db()):
+                return
+            try:
+                db.execute(
+                    "INSERT OR REPLACE INTO ai_eval_cache (key, json, ts) VALUES (?, ?, ?)",
+                    (key, to_json_bytes(dataclasses.asdict(result)), int(time.time())),
+                )
+            except sqlite3.Error:
+                logger.exception("AI cache write failed")
+
+    def _remember(self, key: str, result: AIEvalResult) -> None:
+        self._mem_cache[key] = result
+        self._mem_cache.move_to_end(key)
+        while len(self._mem_cache) > CACHE_MAX_ENTRIES:
+            self._mem_cache.popitem(last=False)
+
+    # Response parsing
+    ##########################################################################
+
     def _parse_response(self, raw_text: str, context: str) -> AIEvalResult:
         print("\n[AI DEBUG] Entering _parse_response() with raw_text:")
         print(raw_text)
         logger.info("AI raw response:\n%s", raw_text)
-        cleaned_text = raw_text.strip()
-        if "</thought_process>" in cleaned_text:
-            _, _, post_thought_process = cleaned_text.rpartition("</thought_process>")
-            if post_thought_process.strip():
-                cleaned_text = post_thought_process.strip()
-        if cleaned_text.startswith("```"):
-            lines = cleaned_text.splitlines()
-            if lines and lines[0].strip().startswith("```"):
-                lines = lines[1:]
-                if lines and lines[-1].strip() == "```":
-                    lines = lines[:-1]
-                cleaned_text = "\n".join(lines).strip()
-            if cleaned_text.lower().startswith("json"):
-                cleaned_text = cleaned_text[4:].strip()
-        if not (cleaned_text.startswith("{") and cleaned_text.endswith("}")):
-            start = cleaned_text.find("{")
-            end = cleaned_text.rfind("}")
-            if start != -1 and end != -1 and end > start:
-                cleaned_text = cleaned_text[start : end + 1]
         try:
-            data = json.loads(cleaned_text)
+            try:
+                # schema-constrained replies are bare JSON and parse directly
+                data = from_json_bytes(raw_text)
+            except json.JSONDecodeError:
+                data = None
+            if not isinstance(data, dict):
+                data = from_json_bytes(_extract_object(raw_text))
             logger.info(
                 "AI response (pretty):\n%s",
                 json.dumps(data, indent=2, sort_keys=True),
             )
-            verdict = data.get("verdict", "Partially Correct")
-            verdict_map = {
-                "pass": "Correct",
-                "borderline": "Partially Correct",
-                "fail": "Incorrect",
-            }
-            verdict = verdict_map.get(verdict, verdict)
-            if verdict not in {"Correct", "Partially Correct", "Incorrect"}:
-                verdict = "Partially Correct"
-
-            suggested_rating = data.get("suggested_rating", 3)
-            rating_map = {1: "Again", 2: "Hard", 3: "Good", 4: "Easy"}
-            if isinstance(suggested_rating, str):
-                if suggested_rating in rating_map.values():
-                    rating_label = suggested_rating
-                else:
-                    try:
-                        rating_label = rating_map[int(suggested_rating)]
-                    except (ValueError, TypeError, KeyError):
-                        rating_label = "Good"
-            elif isinstance(suggested_rating, int):
-                rating_label = rating_map.get(suggested_rating, "Good")
-            else:
-                rating_label = "Good"
-
-            key_fix = data.get("key_fix") or "No key fix provided."
-            memory_tip = data.get("memory_tip") or "No memory tip provided."
-
-            return AIEvalResult(
-                verdict=verdict,
-                suggested_rating=rating_label,
-                key_fix=key_fix,
-                memory_tip=memory_tip,
-                raw_response=raw_text
-            )
+            return self._result_from_data(data, raw_text)
         except json.JSONDecodeError:
             print("[AI DEBUG] JSONDecodeError while parsing AI response.")
             logger.exception("AI response JSON parsing failed. raw_text=%r", raw_text)
@@ -273,6 +805,141 @@ USER_ANSWER: {user_answer}
                 raw_response=raw_text
             )
 
+    def _parse_batch(self, raw_text: str, count: int) -> list[AIEvalResult] | None:
+        "Parse a JSON array reply to a batch; None if it doesn't fit the batch."
+        logger.info("AI raw batch response:\n%s", raw_text)
+        try:
+            data = from_json_bytes(raw_text)
+        except json.JSONDecodeError:
+            data = None
+        if isinstance(data, list):
+            return self._results_from_list(data, raw_text, count)
+        cleaned_text = _strip_wrapping(raw_text)
+        start = cleaned_text.find("[")
+        end = cleaned_text.rfind("]")
+        if start == -1 or end <= start:
+            return None
+        try:
+            data = from_json_bytes(cleaned_text[start : end + 1])
+        except json.JSONDecodeError:
+            return None
+        if not isinstance(data, list):
+            return None
+        return self._results_from_list(data, raw_text, count)
+
+    def _results_from_list(
+        self, data: list[Any], raw_text: str, count: int
+    ) -> list[AIEvalResult] | None:
+        if len(data) != count or not all(isinstance(item, dict) for item in data):
+            return None
+        return [self._result_from_data(item, raw_text) for item in data]
+
+    def _result_from_data(self, data: dict[str, Any], raw_text: str) -> AIEvalResult:
+        if _matches_schema(data):
+            return AIEvalResult(
+                verdict=data["verdict"],
+                suggested_rating=_RATING_MAP[data["suggested_rating"]],
+                key_fix=data["key_fix"],
+                memory_tip=data["memory_tip"],
+                raw_response=raw_text,
+            )
+
+        # lenient normalization for free-form or legacy-shaped replies
+        verdict = data.get("verdict", "Partially Correct")
+        verdict = _VERDICT_MAP.get(verdict, verdict)
+        if verdict not in _VERDICT_SET:
+            verdict = "Partially Correct"
+
+        suggested_rating = data.get("suggested_rating", 3)
+        try:
+            rating_label = _RATING_MAP[int(suggested_rating)]
+        except (ValueError, TypeError, KeyError):
+            if isinstance(suggested_rating, str) and suggested_rating in _RATING_LABELS:
+                rating_label = suggested_rating
+            else:
+                rating_label = "Good"
+
+        key_fix = data.get("key_fix") or "No key fix provided."
+        memory_tip = data.get("memory_tip") or "No memory tip provided."
+
+        return AIEvalResult(
+            verdict=verdict,
+            suggested_rating=rating_label,
+            key_fix=key_fix,
+            memory_tip=memory_tip,
+            raw_response=raw_text
+        )
+
 
 class OllamaClient(AIClient):
-    pass
+    """Grades with a local Ollama model. Only the endpoint, payload shape and
+    response envelope differ; caching and parsing are shared with AIClient."""
+
+    requires_api_key = False
+    # nothing to gain compressing over loopback
+    _gzip_ok = False
+
+    def __init__(
+        self,
+        model: str | None = None,
+        host: str | None = None,
+        cache_path: str | None = None,
+    ) -> None:
+        model = model or os.environ.get("ANKI_OLLAMA_MODEL") or OLLAMA_DEFAULT_MODEL
+        super().__init__(model=model, cache_path=cache_path)
+        host = host or os.environ.get("OLLAMA_HOST") or OLLAMA_HOST
+        self.host = host.rstrip("/")
+        # Ollama unloads idle models after 5 minutes by default, and reloading
+        # multi-GB weights costs seconds on the next grade
+        self.keep_alive = os.environ.get("ANKI_OLLAMA_KEEP_ALIVE") or OLLAMA_KEEP_ALIVE
+
+    def warmup(self) -> None:
+        "Load the model into memory, so the first real grade doesn't pay for it."
+        payload = {"model": self.model, "keep_alive": self.keep_alive}
+        try:
+            with _HTTP.post(
+                self._endpoint(stream=False),
+                data=to_json_bytes(payload),
+                timeout=REQUEST_TIMEOUT,
+            ) as response:
+                response.raise_for_status()
+        except Exception:
+            logger.exception("Ollama warmup failed: model=%s", self.model)
+
+    def warmup_async(self) -> Future[None]:
+        return self._executor.submit(self.warmup)
+
+    def _endpoint(self, stream: bool) -> str:
+        return f"{self.host}/api/generate"
+
+    def _send(
+        self, payload: dict[str, Any], on_partial: Callable[[str], None] | None
+    ) -> str:
+        # Ollama streams NDJSON rather than SSE; replies are short enough
+        # locally that progress reporting isn't worth a second reader
+        return self._request_content(self._endpoint(stream=False), payload)
+
+    def _build_payload(
+        self, user_messages: list[str], cached_content: str | None
+    ) -> dict[str, Any]:
+        schema = RESPONSE_SCHEMA
+        if len(user_messages) > 1:
+            schema = {"type": "array", "items": RESPONSE_SCHEMA}
+        return {
+            "model": self.model,
+            "system": GEMINI_SYSTEM_INSTRUCTION,
+            "prompt": "\n\n".join(user_messages),
+            "stream": False,
+            "format": schema,
+            "keep_alive": self.keep_alive,
+            "options": {
+                "num_predict": MAX_OUTPUT_TOKENS * len(user_messages),
+                "temperature": 0.2,
+            },
+        }
+
+    def _read_content(self, body: bytes) -> str:
+        try:
+            return from_json_bytes(body)["response"]
+        except (KeyError, TypeError) as e:
+            raise ValueError("Ollama response missing expected fields.") from e
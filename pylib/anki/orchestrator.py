@@ -4,6 +4,8 @@ from .ai_client import OllamaClient, AIEvalResult
 class AIReviewOrchestrator:
     def __init__(self):
         self.client = OllamaClient()
+        # load the model weights in the background before the first card
+        self.client.warmup_async()
 
     def evaluate(self, card, user_answer: str) -> AIEvalResult:
         # Extract plain text from card HTML (simplified for MVP)
@@ -0,0 +1,441 @@
+# Copyright: Ankitects Pty Ltd and contributors
+# License: GNU AGPL, version 3 or later; http://www.gnu.org/licenses/agpl.html
+
+import os
+import sqlite3
+import tempfile
+import time
+
+import orjson
+import pytest
+import requests
+
+from anki import ai_client
+from anki.ai_client import (
+    CACHE_TTL_SECS,
+    GEMINI_SYSTEM_INSTRUCTION,
+    RESPONSE_SCHEMA,
+    AIClient,
+    OllamaClient,
+    _chunk_text,
+    _extract_text,
+    _fmt_user,
+)
+
+GOOD_REPLY = (
+    '{"verdict": "Correct", "suggested_rating": 4,'
+    ' "key_fix": "Fix.", "memory_tip": "Tip."}'
+)
+
+
+class FakeResponse:
+    def __init__(self, body: bytes, status: int = 200) -> None:
+        self.content = body
+        self.status_code = status
+
+    def __enter__(self) -> "FakeResponse":
+        return self
+
+    def __exit__(self, *args) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+    @property
+    def ok(self) -> bool:
+        return self.status_code < 400
+
+    def raise_for_status(self) -> None:
+        if self.status_code >= 400:
+            raise requests.HTTPError(response=self)
+
+    def iter_lines(self):
+        return iter(self.content.split(b"\n"))
+
+
+def envelope(text: str) -> bytes:
+    return orjson.dumps({"candidates": [{"content": {"parts": [{"text": text}]}}]})
+
+
+@pytest.fixture
+def http(monkeypatch):
+    """Replace the pooled session's post(). Queue replies (or exceptions to
+    raise) on .replies, and
+    cachedContents registration replies on .cache_replies (default: 400); each
+    generate call is recorded on .calls as (url, decoded payload) with its
+    Content-Encoding on .encodings, and each registration on .cache_calls as
+    (url, Content-Encoding)."""
+
+    class Http:
+        replies: list[FakeResponse | Exception]
+        cache_replies: list[FakeResponse]
+        calls: list[tuple[str, dict]]
+        cache_calls: list[tuple[str, str | None]]
+        encodings: list[str | None]
+
+        def post(self, url, data=None, headers=None, **kwargs):
+            encoding = (headers or {}).get("Content-Encoding")
+            if encoding == "gzip":
+                import gzip
+
+                data = gzip.decompress(data)
+            if "cachedContents" in url:
+                self.cache_calls.append((url, encoding))
+                if self.cache_replies:
+                    return self.cache_replies.pop(0)
+                return FakeResponse(b'{"error": {"code": 400}}', 400)
+            self.calls.append((url, orjson.loads(data)))
+            self.encodings.append(encoding)
+            reply = self.replies.pop(0)
+            if isinstance(reply, Exception):
+                raise reply
+            return reply
+
+    fake = Http()
+    fake.replies = []
+    fake.cache_replies = []
+    fake.calls = []
+    fake.cache_calls = []
+    fake.encodings = []
+    monkeypatch.setattr(ai_client._HTTP, "post", fake.post)
+    return fake
+
+
+def tmp_cache_path() -> str:
+    return os.path.join(tempfile.mkdtemp(), "ai_eval_cache.db")
+
+
+def test_cache_round_trip(http):
+    path = tmp_cache_path()
+    client = AIClient(api_key="key", cache_path=path)
+    http.replies.append(FakeResponse(envelope(GOOD_REPLY)))
+    result = client.generate_response("q", "a", "answer")
+    assert result.suggested_rating == "Easy"
+    client.close()
+
+    # a fresh client with an empty in-memory cache reads it back from disk,
+    # with the user answer normalized
+    client = AIClient(api_key="key", cache_path=path)
+    assert client.generate_response("q", "a", " Answer ") == result
+    assert not http.replies
+    client.close()
+
+
+def test_cache_prompt_version(http, monkeypatch):
+    path = tmp_cache_path()
+    client = AIClient(api_key="key", cache_path=path)
+    http.replies.append(FakeResponse(envelope(GOOD_REPLY)))
+    client.generate_response("q", "a", "answer")
+    client.close()
+
+    # grades stored under a different prompt aren't reused
+    monkeypatch.setattr(ai_client, "_PROMPT_VERSION", "changed")
+    client = AIClient(api_key="key", cache_path=path)
+    http.replies.append(FakeResponse(envelope(GOOD_REPLY)))
+    client.generate_response("q", "a", "answer")
+    assert not http.replies
+    assert len(http.calls) == 2
+    client.close()
+
+
+def test_cache_expiry(http):
+    path = tmp_cache_path()
+    client = AIClient(api_key="key", cache_path=path)
+    key = client._cache_key("q", "a", "answer", False)
+    http.replies.append(FakeResponse(envelope(GOOD_REPLY)))
+    client.generate_response("q", "a", "answer")
+    client.close()
+
+    db = sqlite3.connect(path)
+    expired = int(time.time()) - CACHE_TTL_SECS
+    db.execute("UPDATE ai_eval_cache SET ts = ?", (expired,))
+    db.commit()
+    db.close()
+
+    # expired rows are ignored, and purged when the db is opened
+    client = AIClient(api_key="key", cache_path=path)
+    assert client._cache_get(key) is None
+    client.close()
+    db = sqlite3.connect(path)
+    assert db.execute("SELECT count() FROM ai_eval_cache").fetchone()[0] == 0
+    db.close()
+
+
+def test_parse_failures_not_cached(http):
+    path = tmp_cache_path()
+    client = AIClient(api_key="key", cache_path=path)
+    http.replies.append(FakeResponse(envelope("not json")))
+    result = client.generate_response("q", "a", "answer")
+    assert result.verdict == "fail"
+    client.close()
+
+    db = sqlite3.connect(path)
+    assert db.execute("SELECT count() FROM ai_eval_cache").fetchone()[0] == 0
+    db.close()
+
+
+def test_cached_content_transient_failure(http):
+    client = AIClient(api_key="key")
+    http.cache_replies.append(FakeResponse(b'{"error": {"code": 429}}', 429))
+    http.replies.append(FakeResponse(envelope(GOOD_REPLY)))
+    client.generate_response("q", "a", "one")
+    assert "cachedContent" not in http.calls[-1][1]
+    assert client._cached_content_supported
+
+    # registration is retried once the backoff has passed
+    client._cached_content_retry_at = 0
+    http.cache_replies.append(FakeResponse(b'{"name": "cachedContents/abc"}'))
+    http.replies.append(FakeResponse(envelope(GOOD_REPLY)))
+    client.generate_response("q", "a", "two")
+    assert http.calls[-1][1]["cachedContent"] == "cachedContents/abc"
+
+
+def test_cached_content_unsupported(http):
+    client = AIClient(api_key="key")
+    http.replies.append(FakeResponse(envelope(GOOD_REPLY)))
+    client.generate_response("q", "a", "one")
+    assert not client._cached_content_supported
+
+
+def test_cached_content_expired(http):
+    client = AIClient(api_key="key")
+    client._cached_content_name = "cachedContents/abc"
+    http.replies.append(
+        FakeResponse(b'{"error": {"message": "CachedContent not found"}}', 403)
+    )
+    http.replies.append(FakeResponse(envelope(GOOD_REPLY)))
+    assert client.generate_response("q", "a", "one").suggested_rating == "Easy"
+    assert "cachedContent" not in http.calls[-1][1]
+    assert client._cached_content_name is None
+
+    # other client errors are not retried inline
+    client._cached_content_name = "cachedContents/abc"
+    http.replies.append(FakeResponse(b'{"error": {"message": "bad field"}}', 400))
+    assert client.generate_response("q", "a", "two").verdict == "Incorrect"
+    assert not http.replies
+    assert client._cached_content_name == "cachedContents/abc"
+
+
+def test_extract_text():
+    assert _extract_text(envelope('say "hi"')) == 'say "hi"'
+    # escaped quotes, backslashes and \uXXXX (incl. surrogate pairs)
+    body = rb'{"candidates": [{"content": {"parts": [{"text": "\"a\"\n\u00e9 \\ \ud83d\ude00"}]}}]}'
+    assert _extract_text(body) == '"a"\n\u00e9 \\ \U0001f600'
+    with pytest.raises(ValueError, match="missing expected fields"):
+        _extract_text(b'{"promptFeedback": {"blockReason": "SAFETY"}}')
+
+
+def test_chunk_text():
+    assert _chunk_text(envelope('{"verdict": "Co')) == '{"verdict": "Co'
+    metadata_only = orjson.dumps(
+        {
+            "candidates": [{"finishReason": "STOP"}],
+            "usageMetadata": {"totalTokenCount": 10},
+        }
+    )
+    assert _chunk_text(metadata_only) == ""
+
+
+def test_batch(http):
+    client = AIClient(api_key="key")
+    items = [
+        ("q1", "a1", "x", False),
+        ("q2", "a2", "y", True),
+        ("q3", "a3", "z", False),
+    ]
+    http.replies.append(FakeResponse(envelope(GOOD_REPLY)))
+    cached = client.generate_response(*items[1])
+
+    # the cached item is answered locally; the others share one request
+    reply = GOOD_REPLY.replace("4", "2")
+    http.replies.append(FakeResponse(envelope(f"[{reply}, {reply}]")))
+    results = client.evaluate_batch(items)
+    assert [r.suggested_rating for r in results] == ["Hard", "Easy", "Hard"]
+    assert results[1] == cached
+    texts = [c["parts"][0]["text"] for c in http.calls[-1][1]["contents"]]
+    assert len(texts) == 2
+    # the inline instruction is kept apart from the first item's label
+    assert "}\n\n***\nITEM 0\nFLASHCARD_QUESTION: q1\n" in texts[0]
+    assert texts[1].startswith("\n\n***\nITEM 1\nFLASHCARD_QUESTION: q3\n")
+    assert not http.replies
+
+
+def test_batch_fallback(http):
+    client = AIClient(api_key="key")
+    items = [("q1", "a1", "x", False), ("q2", "a2", "y", False)]
+    # a reply that doesn't match the item count is graded one by one
+    http.replies.append(FakeResponse(envelope(f"[{GOOD_REPLY}]")))
+    http.replies.append(FakeResponse(envelope(GOOD_REPLY)))
+    http.replies.append(FakeResponse(envelope(GOOD_REPLY.replace("4", "3"))))
+    results = client.evaluate_batch(items)
+    assert [r.suggested_rating for r in results] == ["Easy", "Good"]
+    assert len(http.calls) == 3
+
+    # as is a failed batch request
+    items = [("q3", "a3", "x", False), ("q4", "a4", "y", False)]
+    http.replies.append(FakeResponse(b"{}", 500))
+    http.replies.append(FakeResponse(envelope(GOOD_REPLY)))
+    http.replies.append(FakeResponse(envelope(GOOD_REPLY)))
+    assert len(client.evaluate_batch(items)) == 2
+    assert not http.replies
+
+
+def test_parse_batch():
+    client = AIClient(api_key="key")
+    assert len(client._parse_batch(f"[{GOOD_REPLY}, {GOOD_REPLY}]", 2)) == 2
+    wrapped = f"<thought_process>x</thought_process>\n```json\n[{GOOD_REPLY}]\n```"
+    assert len(client._parse_batch(wrapped, 1)) == 1
+    assert client._parse_batch(f"[{GOOD_REPLY}]", 2) is None
+    assert client._parse_batch(GOOD_REPLY, 1) is None
+    assert client._parse_batch("[1, 2]", 2) is None
+
+
+def test_schema_reply_reasoning(http):
+    client = AIClient(api_key="key")
+    reply = '{"thought_process": "1. Fact check: ok", ' + GOOD_REPLY[1:]
+    http.replies.append(FakeResponse(envelope(reply)))
+    result = client.generate_response("q", "a", "answer")
+    assert (result.verdict, result.suggested_rating) == ("Correct", "Easy")
+    assert result.raw_response == reply
+    schema = http.calls[-1][1]["generationConfig"]["responseSchema"]
+    assert schema["propertyOrdering"][0] == "thought_process"
+
+
+def test_stream_endpoint(http):
+    partials: list[str] = []
+    chunks = [envelope(GOOD_REPLY[:20]), envelope(GOOD_REPLY[20:])]
+    sse = b"\n\n".join(b"data: " + chunk for chunk in chunks)
+    client = AIClient(api_key="key")
+    http.replies.append(FakeResponse(sse))
+    result = client.generate_response("q", "a", "one", on_partial=partials.append)
+    assert result.suggested_rating == "Easy"
+    assert partials == [GOOD_REPLY[:20], GOOD_REPLY]
+    assert ":streamGenerateContent" in http.calls[-1][0]
+
+    # a custom generate endpoint isn't bypassed by the default stream one
+    client = AIClient(
+        api_key="key", api_url_template="https://proxy.invalid/{model}?key={api_key}"
+    )
+    http.replies.append(FakeResponse(envelope(GOOD_REPLY)))
+    client.generate_response("q", "a", "two", on_partial=partials.append)
+    assert http.calls[-1][0].startswith("https://proxy.invalid/")
+
+
+def test_generation_config_thinking():
+    def config(model: str) -> dict:
+        client = AIClient(api_key="key", model=model)
+        return client._build_payload(["msg"], None)["generationConfig"]
+
+    # thinking is turned off where possible, so the cap covers only the reply
+    for model in ("gemini-2.5-flash", "gemini-2.5-flash-lite"):
+        assert config(model)["thinkingConfig"] == {"thinkingBudget": 0}
+        assert config(model)["maxOutputTokens"] == ai_client.MAX_OUTPUT_TOKENS
+    # models that always think aren't capped
+    for model in ("gemini-2.5-pro", "gemini-3-pro-preview"):
+        assert "thinkingConfig" not in config(model)
+        assert "maxOutputTokens" not in config(model)
+    # models without thinking are capped as before
+    for model in ("gemini-2.0-flash", "gemma-3-27b-it"):
+        assert "thinkingConfig" not in config(model)
+        assert config(model)["maxOutputTokens"] == ai_client.MAX_OUTPUT_TOKENS
+
+
+@pytest.fixture
+def ollama_env(monkeypatch):
+    for name in (
+        "GEMINI_API_KEY",
+        "ANKI_OLLAMA_MODEL",
+        "OLLAMA_HOST",
+        "ANKI_OLLAMA_KEEP_ALIVE",
+    ):
+        monkeypatch.delenv(name, raising=False)
+
+
+def test_ollama_request(http, ollama_env):
+    client = OllamaClient()
+    http.replies.append(FakeResponse(orjson.dumps({"response": GOOD_REPLY})))
+    # no API key is needed
+    result = client.evaluate_card("q", "a", "answer", "cloze")
+    assert (result.verdict, result.suggested_rating) == ("Correct", "Easy")
+    assert result.raw_response == GOOD_REPLY
+
+    url, payload = http.calls[-1]
+    assert url == "http://localhost:11434/api/generate"
+    assert payload["model"] == "phi4"
+    assert payload["system"] == GEMINI_SYSTEM_INSTRUCTION
+    assert payload["prompt"] == _fmt_user("q", "a", "answer", True)
+    assert payload["stream"] is False
+    assert payload["format"] == RESPONSE_SCHEMA
+    assert not http.cache_calls
+
+
+def test_ollama_missing_response(http, ollama_env):
+    client = OllamaClient()
+    with pytest.raises(ValueError, match="Ollama response missing expected fields"):
+        client._read_content(b'{"done": true}')
+    http.replies.append(FakeResponse(b'{"done": true}'))
+    result = client.evaluate_card("q", "a", "answer")
+    assert result.verdict == "Incorrect"
+    assert "Ollama response missing expected fields" in result.key_fix
+
+
+def test_ollama_warmup(http, ollama_env, monkeypatch):
+    monkeypatch.setenv("ANKI_OLLAMA_KEEP_ALIVE", "-1")
+    client = OllamaClient()
+    http.replies.append(FakeResponse(b'{"done": true}'))
+    client.warmup_async().result()
+    # only loads the model; no prompt is generated
+    assert http.calls[-1] == (
+        "http://localhost:11434/api/generate",
+        {"model": "phi4", "keep_alive": "-1"},
+    )
+
+    http.replies.append(FakeResponse(orjson.dumps({"response": GOOD_REPLY})))
+    client.evaluate_card("q", "a", "answer")
+    assert http.calls[-1][1]["keep_alive"] == "-1"
+
+
+def test_ollama_warmup_failure(http, ollama_env, caplog):
+    client = OllamaClient()
+    assert client.keep_alive == ai_client.OLLAMA_KEEP_ALIVE
+    http.replies.append(FakeResponse(b"{}", 500))
+    http.replies.append(requests.ConnectionError("refused"))
+    with caplog.at_level("ERROR", logger="anki.ai_client"):
+        client.warmup()
+        client.warmup_async().result()
+    assert [r.message for r in caplog.records] == [
+        "Ollama warmup failed: model=phi4"
+    ] * 2
+    assert not http.replies
+
+
+def test_gzip_small_bodies(http):
+    client = AIClient(api_key="key")
+    client._cached_content_name = "cachedContents/abc"
+    http.replies.append(FakeResponse(envelope(GOOD_REPLY)))
+    client.generate_response("q", "a", "one")
+    # a card message referencing the cached instruction isn't worth compressing
+    assert http.encodings == [None]
+
+    # registering the instruction itself is
+    client = AIClient(api_key="key")
+    http.replies.append(FakeResponse(envelope(GOOD_REPLY)))
+    client.generate_response("q", "a", "two")
+    assert http.cache_calls[-1][1] == "gzip"
+
+
+def test_gzip_rejected(http):
+    client = AIClient(api_key="key")
+    http.replies.append(FakeResponse(b"", 415))
+    http.replies.append(FakeResponse(envelope(GOOD_REPLY)))
+    assert client.generate_response("q", "a", "one").suggested_rating == "Easy"
+    # the inline prompt is resent uncompressed, and later requests skip gzip
+    http.replies.append(FakeResponse(envelope(GOOD_REPLY)))
+    client.generate_response("q", "a", "two")
+    assert http.encodings == ["gzip", None, None]
+    assert http.calls[0][1] == http.calls[1][1]
+    assert not client._gzip_ok
+    # other clients keep trying
+    assert AIClient._gzip_ok
+    assert AIClient(api_key="key")._gzip_ok
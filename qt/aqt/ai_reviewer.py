@@ -2,7 +2,9 @@
 import html
 import json
 import logging
+import os
 import traceback
+from functools import lru_cache
 
 from aqt.reviewer import Reviewer
 from aqt.qt import *
@@ -12,13 +14,53 @@ from anki.utils import strip_html
 
 logger = logging.getLogger(__name__)
 
+
+@lru_cache(maxsize=512)
+def _clean(html: str) -> str:
+    # keyed on the rendered html, so re-submits and repeat cards skip the scrub
+    return strip_html(html)
+
+
+_client: AIClient | None = None
+
+
+def _shared_client() -> AIClient:
+    # one client for all AI review sessions, so the in-memory cache survives
+    # between sessions and only one sqlite connection is ever open
+    global _client
+    if _client is None:
+        _client = AIClient()
+    return _client
+
+
+def _set_feedback_js(inner_html: str) -> str:
+    # a single placeholder node is reused per card; assigning its innerHTML
+    # avoids reparsing the rest of the page. json.dumps() escapes for JS.
+    return (
+        "(() => { let e = document.getElementById('ai-feedback');"
+        " if (!e) { e = document.createElement('div'); e.id = 'ai-feedback';"
+        " document.body.appendChild(e); }"
+        f" e.innerHTML = {json.dumps(inner_html)}; }})();"
+    )
+
+
 class AIReviewer(Reviewer):
     def __init__(self, mw):
         super().__init__(mw)
-        self.client = AIClient()
-        self.input_field = None
-        self.submit_btn = None
+        self.client = _shared_client()
+        # built once and reused for every card; _showQuestion only resets them
+        layout = mw.mainLayout
+        self.input_field = QTextEdit()
+        self.input_field.setPlaceholderText("Type or speak your answer here...")
+        self.input_field.setMaximumHeight(100)
+        self.input_field.hide()
+        layout.addWidget(self.input_field)
+        self.submit_btn = QPushButton("Evaluate with AI")
+        self.submit_btn.clicked.connect(self.on_evaluate)
+        self.submit_btn.hide()
+        layout.addWidget(self.submit_btn)
         self.ai_feedback_label = None
+        self._is_cloze = False
 
     def _initWeb(self):
         super()._initWeb()
@@ -28,24 +70,31 @@ class AIReviewer(Reviewer):
         # Here we assume a simple Qt widget overlay for the input.
         pass
 
+    def show(self):
+        # follow the current profile; the db is opened on first use
+        path = os.path.join(self.mw.pm.profileFolder(), "ai_eval_cache.db")
+        if path != self.client.cache_path:
+            self.client.close()
+            self.client.cache_path = path
+        super().show()
+
     def _showQuestion(self):
         super()._showQuestion()
-        self.web.eval("document.getElementById('ai-feedback')?.remove();")
-        # 1. Clear previous state
-        if self.input_field:
-            self.input_field.deleteLater()
-        
-        # 2. Add Input Field (Free-form answer)
-        layout = self.mw.mainLayout
-        self.input_field = QTextEdit()
-        self.input_field.setPlaceholderText("Type or speak your answer here...")
-        self.input_field.setMaximumHeight(100)
-        layout.addWidget(self.input_field)
+        self._is_cloze = self.card.note_type()["type"] == 1
+        self.web.eval(_set_feedback_js(""))
+        # Reset the input widgets for the new card
+        self.input_field.clear()
+        self.input_field.show()
+        self.submit_btn.setText("Evaluate with AI")
+        self.submit_btn.setEnabled(True)
+        self.submit_btn.show()
 
-        # 3. Add Evaluate Button
-        self.submit_btn = QPushButton("Evaluate with AI")
-        self.submit_btn.clicked.connect(self.on_evaluate)
-        layout.addWidget(self.submit_btn)
+    def cleanup(self):
+        super().cleanup()
+        # the widgets live in the main layout, so hide them when leaving review
+        self.input_field.hide()
+        self.submit_btn.hide()
+        self.client.close()
 
     def on_evaluate(self):
         cid = self.card.id
@@ -56,22 +105,32 @@ class AIReviewer(Reviewer):
         user_ans = self.input_field.toPlainText()
         question_html = self.card.question()
         answer_html = self.card.answer()
-        cleaned_question = strip_html(question_html)
-        cleaned_answer = strip_html(answer_html)
-        is_cloze = self.card.note_type()["type"] == 1
-
-        # Run in background to avoid freezing UI
-        self.mw.taskman.run_in_background(
-            lambda: self.client.generate_response(
-                cleaned_question,
-                cleaned_answer,
-                user_ans,
-                is_cloze=is_cloze,
-            ),
-            lambda future, expected_cid=cid: self.on_evaluation_complete(
-                future, expected_cid
+        cleaned_question = _clean(question_html)
+        cleaned_answer = _clean(answer_html)
+
+        # Run on the AI worker pool to avoid freezing UI; the request doesn't
+        # touch the collection, so it shouldn't queue behind collection ops
+        future = self.client.generate_response_async(
+            cleaned_question,
+            cleaned_answer,
+            user_ans,
+            is_cloze=self._is_cloze,
+            on_partial=lambda text, expected_cid=cid: self.mw.taskman.run_on_main(
+                lambda: self.on_evaluation_progress(text, expected_cid)
             ),
         )
+        future.add_done_callback(
+            lambda future, expected_cid=cid: self.mw.taskman.run_on_main(
+                lambda: self.on_evaluation_complete(future, expected_cid)
+            )
+        )
+
+    def on_evaluation_progress(self, partial_text, expected_cid):
+        if not self.card or self.card.id != expected_cid:
+            return
+        # the streamed text is the model's JSON, so show progress rather than
+        # the raw fragment
+        self.submit_btn.setText(f"Thinking... ({len(partial_text)} chars)")
 
     def on_evaluation_complete(self, future, expected_cid):
         if not self.card or self.card.id != expected_cid:
@@ -104,9 +163,9 @@ class AIReviewer(Reviewer):
         # Call standard showAnswer to render the back of the card
         super()._showAnswer()
         
-        # Remove input widgets
-        if self.input_field: self.input_field.hide()
-        if self.submit_btn: self.submit_btn.hide()
+        # Hide input widgets
+        self.input_field.hide()
+        self.submit_btn.hide()
 
         # Display AI Feedback
         if ai_result:
@@ -120,16 +179,13 @@ class AIReviewer(Reviewer):
                 },
             )
             feedback = f"""
-            <div id="ai-feedback">
             <h3>AI Feedback</h3>
             <b>Verdict:</b> {html.escape(str(ai_result.verdict))}<br>
             <b>Suggested Rating:</b> {html.escape(str(ai_result.suggested_rating))}<br>
             <b>Key Fix:</b> {html.escape(str(ai_result.key_fix))}<br>
             <b>Memory Tip:</b> {html.escape(str(ai_result.memory_tip))}
-            </div>
             """
-            # Append feedback to the webview
-            js = f"document.body.insertAdjacentHTML('beforeend', {json.dumps(feedback)});"
-            print("[AI DEBUG] Executing webview JS for AI feedback append.")
+            js = _set_feedback_js(feedback)
+            print("[AI DEBUG] Executing webview JS for AI feedback update.")
             logger.info("AI feedback JS payload length=%s", len(js))
             self.web.eval(js)
@@ -102,7 +102,9 @@ class Overview:
         elif url == "ai_review":
             from aqt.ai_reviewer import AIReviewer
 
-            self.mw.reviewer = AIReviewer(self.mw)
+            # reuse the one AI reviewer; its widgets live in the main layout
+            if not isinstance(self.mw.reviewer, AIReviewer):
+                self.mw.reviewer = AIReviewer(self.mw)
             self.mw.col.startTimebox()
             self.mw.moveToState("review")
         elif url == "anki":